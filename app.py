@@ -2,31 +2,123 @@
 API Localizador - Recebe localização e serve mapa
 Configurado para deploy no Render.com
 """
-import json
+import atexit
 import os
 import random
+import threading
 import time
-from dataclasses import asdict, dataclass
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
 from pathlib import Path
-from urllib.parse import quote
 
+import orjson
 import requests
-from flask import Flask, Response, jsonify, request, send_from_directory
+from requests.adapters import HTTPAdapter
+from flask import Flask, Response, request, send_from_directory, stream_with_context
+from flask_compress import Compress
 from flask_cors import CORS
 
 app = Flask(__name__, static_folder="static")
+app.config["COMPRESS_MIMETYPES"] = ["application/json"]
+app.config["COMPRESS_MIN_SIZE"] = 1024
+Compress(app)
 CORS(app, resources={r"/api/*": {"origins": "*", "methods": ["GET", "POST", "OPTIONS"], "allow_headers": ["Content-Type"]}})
 
-# Armazena as últimas localizações por device_id
-localizacoes = {}
-# Histórico de localizações por dispositivo (para o rastro)
-historico = {}
-# Cache de endereços para evitar muitas requisições ao Nominatim
-cache_enderecos = {}
+# Sessão HTTP compartilhada (keep-alive com Nominatim/Photon/ViaCEP)
+SESSION = requests.Session()
+_http_adapter = HTTPAdapter(pool_connections=8, pool_maxsize=32, max_retries=0)
+SESSION.mount("https://", _http_adapter)
+# Política de uso do Nominatim: no máximo 1 requisição por segundo (vale para todo o processo)
+NOMINATIM_INTERVALO = 1.0
+_nominatim_lock = threading.Lock()
+_ultima_chamada_nominatim = 0.0
+
+
+def _aguardar_nominatim() -> None:
+    """Bloqueia até passar NOMINATIM_INTERVALO desde a última chamada ao Nominatim"""
+    global _ultima_chamada_nominatim
+    with _nominatim_lock:
+        espera = _ultima_chamada_nominatim + NOMINATIM_INTERVALO - time.time()
+        if espera > 0:
+            time.sleep(espera)
+        _ultima_chamada_nominatim = time.time()
+
+# Pool para disparar consultas de geocoding em paralelo: 2 tarefas por requisição,
+# dimensionado para as 8 threads do gunicorn (gunicorn.conf.py) não enfileirarem
+_geocode_pool = ThreadPoolExecutor(max_workers=16)
+
+# Protege localizacoes, historico e o log de histórico (acessados por várias threads)
+_estado_lock = threading.RLock()
+# Protege cache_enderecos
+_cache_lock = threading.Lock()
+# Serializa leitura-modificação-gravação do arquivo de nomes
+_nomes_lock = threading.Lock()
+
+# Armazena as últimas localizações por device_id (ordem: menos recente primeiro)
+localizacoes = OrderedDict()
+# Limite de dispositivos em memória; o menos recente é descartado ao exceder
+LOCALIZACOES_MAX = 10_000
+# Dispositivos sem localização nova há mais que isso (segundos) são removidos
+LOCALIZACOES_TTL = 86400
+# Intervalo (segundos) entre varreduras de localizações expiradas
+LOCALIZACOES_EXPIRAR_INTERVALO = 60
+# Último ponto pendente de reverse geocoding por dispositivo: {device_id: (lat, lng)}
+# (um POST novo substitui o ponto ainda não resolvido; limitado a LOCALIZACOES_MAX)
+_geo_pendentes = OrderedDict()
+_geo_lock = threading.Lock()
+_geo_evento = threading.Event()
+# Histórico de localizações por dispositivo (para o rastro): deque de (lat, lng, timestamp)
+# (ordem: atualizado há mais tempo primeiro; limitado a HISTORICO_MAX_DISPOSITIVOS)
+historico = OrderedDict()
 # Arquivo de nomes dos dispositivos
 nomes_file = Path(__file__).parent / "nomes_dispositivos.json"
-# Arquivo de histórico por dispositivo (persistido localmente)
-historico_file = Path(__file__).parent / "historico.json"
+# Conteúdo do arquivo de nomes em memória, validado pelo mtime
+_nomes_bytes = None
+_nomes_mtime = 0
+# Arquivo do cache de reverse geocoding: {"latq_lngq": [endereco, timestamp]}
+# (em memória a chave é a tupla (lat_q, lng_q))
+geocode_cache_file = Path(__file__).parent / "geocode_cache.json"
+# Limite de entradas do cache de endereços (LRU)
+GEOCODE_CACHE_MAX = 4096
+# Entradas mais antigas que isso (segundos) são descartadas ao carregar
+GEOCODE_CACHE_TTL = 30 * 86400
+# Quantidade de novos endereços antes de gravar o cache em disco
+GEOCODE_CACHE_SALVAR_A_CADA = 20
+_geocode_inseridos = 0
+# Arquivo de histórico por dispositivo (log append-only, uma linha JSON por ponto)
+historico_file = Path(__file__).parent / "historico.ndjson"
+# Formato antigo (dict completo), migrado para o log na primeira carga
+historico_legado_file = Path(__file__).parent / "historico.json"
+# Pontos mantidos por dispositivo (memória e arquivo)
+HISTORICO_MAX_PONTOS = 2000
+# Limite de dispositivos com histórico; o atualizado há mais tempo é descartado ao exceder
+HISTORICO_MAX_DISPOSITIVOS = 10_000
+# Intervalo mínimo (segundos) entre flushes do log de histórico
+HISTORICO_FLUSH_INTERVALO = 5.0
+# Quantidade de pontos acrescentados ao log antes de compactá-lo
+HISTORICO_COMPACTAR_A_CADA = 10000
+# Controle da gravação adiada do histórico
+_historico_log = None
+_historico_sujo = False
+_ultimo_save_historico = 0.0
+_appends_desde_compactacao = 0
+# Linhas lidas do log na carga (para decidir se compacta ao iniciar)
+_linhas_log_carregadas = 0
+
+
+def fast_json(obj) -> Response:
+    """Resposta JSON serializada com orjson (substitui jsonify)"""
+    return Response(orjson.dumps(obj), mimetype="application/json")
+
+
+def ler_json():
+    """Lê o corpo da requisição com orjson (sem exigir Content-Type); None se inválido"""
+    try:
+        data = orjson.loads(request.get_data(cache=False))
+    except orjson.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
 
 
 @dataclass
@@ -37,6 +129,8 @@ class Localizacao:
     timestamp: float
     endereco: str = ""
     bateria: float = None
+    # Horário do servidor ao receber (timestamp vem do cliente e não é confiável para expiração)
+    recebido_em: float = 0.0
 
     def to_dict(self):
         d = {
@@ -52,48 +146,195 @@ class Localizacao:
 
 
 def carregar_nomes():
-    """Carrega nomes dos dispositivos do arquivo"""
-    if nomes_file.exists():
-        try:
-            with open(nomes_file, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            pass
+    """Carrega nomes dos dispositivos do arquivo (relê do disco só se o mtime mudar).
+    Devolve sempre um dict novo: quem chama pode alterá-lo sem afetar o cache."""
+    global _nomes_bytes, _nomes_mtime
+    try:
+        mtime = nomes_file.stat().st_mtime_ns
+    except OSError:
+        return {}
+    try:
+        if _nomes_bytes is None or mtime != _nomes_mtime:
+            _nomes_bytes = nomes_file.read_bytes()
+            _nomes_mtime = mtime
+        return orjson.loads(_nomes_bytes)
+    except Exception:
+        pass
     return {}
 
 
 def salvar_nomes(nomes: dict):
     """Salva nomes dos dispositivos no arquivo"""
-    with open(nomes_file, "w", encoding="utf-8") as f:
-        json.dump(nomes, f, ensure_ascii=False, indent=2)
+    global _nomes_bytes, _nomes_mtime
+    dados = orjson.dumps(nomes)
+    tmp = nomes_file.with_suffix(".json.tmp")
+    tmp.write_bytes(dados)
+    os.replace(tmp, nomes_file)
+    _nomes_bytes = dados
+    _nomes_mtime = nomes_file.stat().st_mtime_ns
 
 
 def carregar_historico() -> dict:
-    """Carrega histórico dos dispositivos do arquivo"""
+    """Carrega histórico dos dispositivos do log NDJSON (uma linha por ponto)"""
+    global _linhas_log_carregadas
+    dados = {}
+    _linhas_log_carregadas = 0
     if historico_file.exists():
         try:
-            with open(historico_file, "r", encoding="utf-8") as f:
-                return json.load(f)
+            with open(historico_file, "rb") as f:
+                for linha in f:
+                    _linhas_log_carregadas += 1
+                    try:
+                        p = orjson.loads(linha)
+                        did, ponto = str(p["d"]), (p["lat"], p["lng"], p["t"])
+                    except (ValueError, KeyError, TypeError):
+                        # Linha incompleta (queda no meio da escrita) ou malformada
+                        continue
+                    pontos = dados.get(did)
+                    if pontos is None:
+                        pontos = dados[did] = deque(maxlen=HISTORICO_MAX_PONTOS)
+                    pontos.append(ponto)
         except Exception:
             pass
-    return {}
+    elif historico_legado_file.exists():
+        # Migra o antigo historico.json (dict completo) para o log
+        try:
+            legado = orjson.loads(historico_legado_file.read_bytes())
+            dados = {
+                did: deque(((p["lat"], p["lng"], p["timestamp"]) for p in pontos), maxlen=HISTORICO_MAX_PONTOS)
+                for did, pontos in legado.items()
+            }
+        except Exception:
+            pass
+    return dados
+
+
+def _linha_historico(device_id: str, lat: float, lng: float, timestamp: float) -> bytes:
+    return orjson.dumps({"d": device_id, "lat": lat, "lng": lng, "t": timestamp}) + b"\n"
+
+
+def _fechar_log_historico() -> None:
+    global _historico_log
+    with _estado_lock:
+        if _historico_log is not None:
+            try:
+                _historico_log.close()
+            except Exception:
+                pass
+            _historico_log = None
 
 
 def salvar_historico() -> None:
-    """Salva histórico no arquivo (últimos 2000 por dispositivo)"""
-    try:
-        limitado = {
-            did: (pontos[-2000:] if len(pontos) > 2000 else pontos)
-            for did, pontos in historico.items()
-        }
-        with open(historico_file, "w", encoding="utf-8") as f:
-            json.dump(limitado, f, ensure_ascii=False, indent=0)
-    except Exception:
-        pass
+    """Compacta o log: reescreve o histórico em memória (últimos 2000 por dispositivo)"""
+    global _historico_sujo, _ultimo_save_historico, _appends_desde_compactacao
+    with _estado_lock:
+        _ultimo_save_historico = time.time()
+        try:
+            _fechar_log_historico()
+            tmp = historico_file.with_suffix(".ndjson.tmp")
+            with open(tmp, "wb") as f:
+                for did, pontos in historico.items():
+                    for lat, lng, ts in pontos:
+                        f.write(_linha_historico(did, lat, lng, ts))
+            os.replace(tmp, historico_file)
+            # Só limpa a marca depois de gravar; em caso de erro a próxima volta tenta de novo
+            _historico_sujo = False
+            _appends_desde_compactacao = 0
+        except Exception:
+            pass
+
+
+def flush_historico() -> None:
+    """Descarrega o buffer do log de histórico para o disco"""
+    global _historico_sujo, _ultimo_save_historico
+    with _estado_lock:
+        _ultimo_save_historico = time.time()
+        try:
+            if _historico_log is not None:
+                _historico_log.flush()
+            _historico_sujo = False
+        except Exception:
+            pass
+
+
+def registrar_ponto_historico(device_id: str, lat: float, lng: float, timestamp: float) -> None:
+    """Acrescenta um ponto ao log (O(1) por POST); flush adiado e compactação periódica"""
+    global _historico_log, _historico_sujo, _appends_desde_compactacao
+    with _estado_lock:
+        try:
+            if _historico_log is None:
+                _historico_log = open(historico_file, "ab", buffering=8192)
+            _historico_log.write(_linha_historico(device_id, lat, lng, timestamp))
+        except Exception:
+            return
+        _appends_desde_compactacao += 1
+        if _appends_desde_compactacao >= HISTORICO_COMPACTAR_A_CADA:
+            salvar_historico()
+            return
+        _historico_sujo = True
+        if time.time() - _ultimo_save_historico > HISTORICO_FLUSH_INTERVALO:
+            flush_historico()
+
+
+def descartar_historico(device_id: str) -> None:
+    """Remove o histórico do dispositivo da memória; as linhas dele no log passam a
+    contar para a próxima compactação, que as remove do arquivo"""
+    global _appends_desde_compactacao
+    with _estado_lock:
+        pontos = historico.pop(device_id, None)
+        if pontos is not None:
+            _appends_desde_compactacao += len(pontos)
+
+
+def remover_localizacoes_expiradas() -> None:
+    """Remove dispositivos sem localização nova há mais de LOCALIZACOES_TTL segundos"""
+    limite = time.time() - LOCALIZACOES_TTL
+    with _estado_lock:
+        # Ordem de localizacoes é a de recebimento: para no primeiro ainda válido
+        while localizacoes:
+            device_id, loc = next(iter(localizacoes.items()))
+            if loc.recebido_em >= limite:
+                break
+            del localizacoes[device_id]
+
+
+def _loop_manutencao() -> None:
+    """Thread de fundo: agrupa rajadas de POSTs em um único flush e expira localizações antigas"""
+    ultima_expiracao = time.time()
+    while True:
+        time.sleep(HISTORICO_FLUSH_INTERVALO)
+        if _historico_sujo:
+            flush_historico()
+        if time.time() - ultima_expiracao >= LOCALIZACOES_EXPIRAR_INTERVALO:
+            ultima_expiracao = time.time()
+            remover_localizacoes_expiradas()
 
 
 # Carrega histórico do arquivo (após definição das funções)
 historico.update(carregar_historico())
+while len(historico) > HISTORICO_MAX_DISPOSITIVOS:
+    historico.popitem(last=False)
+# Compacta ao iniciar se o log tem mais linhas que os pontos mantidos: o contador
+# de appends recomeça a cada processo, então sem isso o log cresceria a cada reinício
+if historico_file.exists():
+    if _linhas_log_carregadas > sum(len(pontos) for pontos in historico.values()):
+        salvar_historico()
+elif historico:
+    salvar_historico()
+threading.Thread(target=_loop_manutencao, daemon=True).start()
+# Garante que o histórico pendente seja gravado ao encerrar o processo
+atexit.register(_fechar_log_historico)
+
+
+# Campos do Nominatim em ordem de prioridade
+_RUA_KEYS = ("road", "street", "pedestrian")
+# Bairro: neighbourhood é mais específico; suburb pode ser região maior
+_BAIRRO_KEYS = ("neighbourhood", "suburb", "quarter", "city_district", "district", "residential")
+_CIDADE_KEYS = ("city", "town", "village", "municipality", "county")
+
+
+def _first(addr: dict, keys: tuple) -> str:
+    return next((addr[k] for k in keys if addr.get(k)), "")
 
 
 def _formatar_endereco_simples(addr: dict) -> str:
@@ -101,67 +342,146 @@ def _formatar_endereco_simples(addr: dict) -> str:
     Prioridade para bairro: neighbourhood (mais local) antes de suburb (mais amplo)."""
     if not addr:
         return "Endereço não encontrado"
-    rua = addr.get("road") or addr.get("street") or addr.get("pedestrian") or ""
-    # Bairro: neighbourhood é mais específico; suburb pode ser região maior
-    bairro = (
-        addr.get("neighbourhood")
-        or addr.get("suburb")
-        or addr.get("quarter")
-        or addr.get("city_district")
-        or addr.get("district")
-        or addr.get("residential")
-        or ""
-    )
-    cidade = (
-        addr.get("city")
-        or addr.get("town")
-        or addr.get("village")
-        or addr.get("municipality")
-        or addr.get("county")
-        or ""
-    )
-    partes = [p for p in (rua, bairro, cidade) if p]
+    partes = [p for p in (_first(addr, k) for k in (_RUA_KEYS, _BAIRRO_KEYS, _CIDADE_KEYS)) if p]
     return ", ".join(partes) if partes else "Endereço não encontrado"
 
 
+def carregar_cache_enderecos() -> OrderedDict:
+    """Carrega o cache de endereços do disco, descartando entradas antigas"""
+    cache = OrderedDict()
+    if geocode_cache_file.exists():
+        try:
+            dados = orjson.loads(geocode_cache_file.read_bytes())
+            limite = time.time() - GEOCODE_CACHE_TTL
+            # Mais antigas primeiro, para a ordem LRU continuar válida
+            for chave, (endereco, ts) in sorted(dados.items(), key=lambda kv: kv[1][1]):
+                if ts >= limite:
+                    lat_q, lng_q = chave.split("_")
+                    cache[(int(lat_q), int(lng_q))] = [endereco, ts]
+        except Exception:
+            pass
+    while len(cache) > GEOCODE_CACHE_MAX:
+        cache.popitem(last=False)
+    return cache
+
+
+def salvar_cache_enderecos() -> None:
+    """Grava o cache de endereços de forma atômica (tmp + os.replace)"""
+    global _geocode_inseridos
+    _geocode_inseridos = 0
+    try:
+        tmp = geocode_cache_file.with_suffix(".json.tmp")
+        with _cache_lock:
+            dados = {f"{lat_q}_{lng_q}": v for (lat_q, lng_q), v in cache_enderecos.items()}
+        tmp.write_bytes(orjson.dumps(dados))
+        os.replace(tmp, geocode_cache_file)
+    except Exception:
+        pass
+
+
 def reverse_geocode(lat: float, lng: float) -> str:
     """Obtém endereço (rua, bairro, cidade) a partir de coordenadas usando Nominatim.
+    Coordenadas são quantizadas em 3 casas decimais (~111m) para o cache LRU."""
+    return _reverse_geocode_q(round(lat * 1000), round(lng * 1000))
+
+
+def _reverse_geocode_q(lat_q: int, lng_q: int) -> str:
+    """Como reverse_geocode, mas recebe coordenadas já quantizadas (graus * 1000).
     Usa zoom=16 para melhor precisão de rua/bairro (evita matching em pontos distantes)."""
-    cache_key = f"{lat:.4f}_{lng:.4f}"
-    if cache_key in cache_enderecos:
-        return cache_enderecos[cache_key]
+    global _geocode_inseridos
+    cache_key = (lat_q, lng_q)
+    with _cache_lock:
+        entrada = cache_enderecos.get(cache_key)
+        if entrada is not None:
+            cache_enderecos.move_to_end(cache_key)
+            return entrada[0]
 
     try:
         # zoom=16: ruas principais e secundárias, melhor matching de bairro
-        url = f"https://nominatim.openstreetmap.org/reverse?lat={lat}&lon={lng}&format=json&zoom=16&addressdetails=1&accept-language=pt"
+        url = f"https://nominatim.openstreetmap.org/reverse?lat={lat_q / 1000}&lon={lng_q / 1000}&format=json&zoom=16&addressdetails=1&accept-language=pt"
         headers = {"User-Agent": "LocalizadorApp/1.0"}
-        resp = requests.get(url, headers=headers, timeout=5)
+        _aguardar_nominatim()
+        resp = SESSION.get(url, headers=headers, timeout=5)
         if resp.status_code == 200:
             data = resp.json()
             addr = data.get("address", {})
             endereco = _formatar_endereco_simples(addr)
-            cache_enderecos[cache_key] = endereco
+            with _cache_lock:
+                cache_enderecos[cache_key] = [endereco, time.time()]
+                if len(cache_enderecos) > GEOCODE_CACHE_MAX:
+                    cache_enderecos.popitem(last=False)
+                _geocode_inseridos += 1
+                salvar = _geocode_inseridos >= GEOCODE_CACHE_SALVAR_A_CADA
+            if salvar:
+                salvar_cache_enderecos()
             return endereco
     except Exception:
         pass
     return "Endereço não disponível"
 
 
+# Cache de endereços persistido (sobrevive a reinícios no Render.com)
+cache_enderecos = carregar_cache_enderecos()
+atexit.register(salvar_cache_enderecos)
+
+
+def agendar_reverse_geocode(device_id: str, lat: float, lng: float) -> None:
+    """Agenda o endereço do ponto mais recente do dispositivo (descarta o pendente anterior).
+    Um dispositivo já pendente mantém a posição na fila."""
+    with _geo_lock:
+        _geo_pendentes[device_id] = (lat, lng)
+        while len(_geo_pendentes) > LOCALIZACOES_MAX:
+            _geo_pendentes.popitem(last=False)
+    _geo_evento.set()
+
+
+def _ponto_atual(device_id: str, lat: float, lng: float) -> bool:
+    loc = localizacoes.get(device_id)
+    return loc is not None and loc.lat == lat and loc.lng == lng
+
+
+def _loop_reverse_geocode() -> None:
+    """Thread de fundo: resolve endereços fora do caminho das requisições"""
+    while True:
+        _geo_evento.wait()
+        with _geo_lock:
+            if not _geo_pendentes:
+                _geo_evento.clear()
+                continue
+            device_id, (lat, lng) = _geo_pendentes.popitem(last=False)
+        try:
+            # Evita a chamada ao Nominatim se o dispositivo já se moveu ou foi removido
+            with _estado_lock:
+                if not _ponto_atual(device_id, lat, lng):
+                    continue
+            endereco = reverse_geocode(lat, lng)
+            with _estado_lock:
+                if _ponto_atual(device_id, lat, lng):
+                    localizacoes[device_id].endereco = endereco
+        except Exception:
+            pass
+
+
+threading.Thread(target=_loop_reverse_geocode, daemon=True).start()
+
+
 @app.route("/api/ping")
 def ping():
     """End-point para testar se a API está acessível"""
-    return jsonify({"ok": True, "mensagem": "API online"})
+    return fast_json({"ok": True, "mensagem": "API online"})
 
 
 @app.route("/api/localizacao", methods=["POST"])
 def receber_localizacao():
     """Recebe localização enviada pelo app"""
     try:
-        data = request.get_json()
+        data = ler_json()
+        if data is None:
+            return fast_json({"erro": "JSON inválido"}), 400
         if not data or "lat" not in data or "lng" not in data:
-            return jsonify({"erro": "Dados inválidos"}), 400
+            return fast_json({"erro": "Dados inválidos"}), 400
 
-        device_id = data.get("device_id", "dispositivo_1")
+        device_id = str(data.get("device_id") or "dispositivo_1")
         lat = float(data["lat"])
         lng = float(data["lng"])
         timestamp = data.get("timestamp", time.time())
@@ -180,103 +500,142 @@ def receber_localizacao():
             lng=lng,
             timestamp=timestamp,
             endereco="",
-            bateria=bateria
+            bateria=bateria,
+            recebido_em=time.time(),
         )
-        localizacoes[device_id] = loc
-        # Adiciona ao histórico (últimas 500 em memória, 2000 persistidos)
-        if device_id not in historico:
-            historico[device_id] = []
-        historico[device_id].append({"lat": lat, "lng": lng, "timestamp": timestamp})
-        historico[device_id] = historico[device_id][-2000:]
-        salvar_historico()
-        return jsonify({"ok": True, "mensagem": "Localização recebida"})
+        with _estado_lock:
+            localizacoes[device_id] = loc
+            localizacoes.move_to_end(device_id)
+            while len(localizacoes) > LOCALIZACOES_MAX:
+                # Descarta junto o histórico (ids arbitrários não podem crescer a memória)
+                antigo, _ = localizacoes.popitem(last=False)
+                descartar_historico(antigo)
+            # Adiciona ao histórico (deque descarta sozinho além de 2000 pontos)
+            pontos = historico.get(device_id)
+            if pontos is None:
+                pontos = historico[device_id] = deque(maxlen=HISTORICO_MAX_PONTOS)
+            historico.move_to_end(device_id)
+            while len(historico) > HISTORICO_MAX_DISPOSITIVOS:
+                descartar_historico(next(iter(historico)))
+            pontos.append((lat, lng, timestamp))
+            registrar_ponto_historico(device_id, lat, lng, timestamp)
+        agendar_reverse_geocode(device_id, lat, lng)
+        return fast_json({"ok": True, "mensagem": "Localização recebida"})
     except Exception as e:
-        return jsonify({"erro": str(e)}), 500
+        return fast_json({"erro": str(e)}), 500
 
 
 @app.route("/api/localizacoes")
 def listar_localizacoes():
     """Retorna todas as localizações atuais"""
-    lista = [asdict(loc) for loc in localizacoes.values()]
-    return jsonify(lista)
+    with _estado_lock:
+        lista = [loc.to_dict() for loc in localizacoes.values()]
+    return fast_json(lista)
 
 
 @app.route("/api/historico")
 def lista_historico():
-    """Retorna o histórico de localizações por dispositivo (para o rastro)"""
-    return jsonify(historico)
+    """Retorna o histórico de localizações por dispositivo (para o rastro).
+    Resposta em streaming: só um dispositivo é serializado por vez."""
+    def gerar():
+        yield b"{"
+        with _estado_lock:
+            dispositivos = list(historico.items())
+        for i, (did, pontos) in enumerate(dispositivos):
+            with _estado_lock:
+                pontos = list(pontos)
+            if i:
+                yield b","
+            yield orjson.dumps(str(did)) + b":"
+            yield orjson.dumps([{"lat": lat, "lng": lng, "timestamp": ts} for lat, lng, ts in pontos])
+        yield b"}"
+
+    return Response(stream_with_context(gerar()), mimetype="application/json")
 
 
 @app.route("/api/nomes", methods=["GET"])
 def obter_nomes():
     """Retorna os nomes personalizados dos dispositivos (com ícone e cor)"""
-    return jsonify(carregar_nomes())
+    with _nomes_lock:
+        return fast_json(carregar_nomes())
 
 
 @app.route("/api/cadastrar", methods=["POST"])
 def cadastrar_rastreador():
     """Cadastra novo rastreador com nome, ícone e cor. Retorna device_id (código) para usar no app."""
     try:
-        data = request.get_json()
+        data = ler_json()
+        if data is None:
+            return fast_json({"erro": "JSON inválido"}), 400
         nome = (data.get("nome") or "").strip()
         if not nome:
-            return jsonify({"erro": "Nome obrigatório"}), 400
+            return fast_json({"erro": "Nome obrigatório"}), 400
         icon = (data.get("icon") or "🚗").strip() or "🚗"
         color = (data.get("color") or "#00d4aa").strip() or "#00d4aa"
-        device_id = "R" + str(random.randint(10000, 99999))
-        nomes = carregar_nomes()
-        while device_id in nomes:
-            device_id = "R" + str(random.randint(10000, 99999))
-        nomes[device_id] = {"nome": nome, "icon": icon, "color": color}
-        salvar_nomes(nomes)
-        return jsonify({"ok": True, "device_id": device_id, "nome": nome, "icon": icon, "color": color})
+        with _nomes_lock:
+            nomes = carregar_nomes()
+            used = set(nomes)
+            candidatos = {f"R{n}" for n in random.sample(range(10000, 100000), 20)} - used
+            if candidatos:
+                device_id = next(iter(candidatos))
+            else:
+                device_id = "R" + str(random.randint(10000, 99999))
+                while device_id in used:
+                    device_id = "R" + str(random.randint(10000, 99999))
+            nomes[device_id] = {"nome": nome, "icon": icon, "color": color}
+            salvar_nomes(nomes)
+        return fast_json({"ok": True, "device_id": device_id, "nome": nome, "icon": icon, "color": color})
     except Exception as e:
-        return jsonify({"erro": str(e)}), 500
+        return fast_json({"erro": str(e)}), 500
 
 
 @app.route("/api/dispositivo/<device_id>", methods=["DELETE"])
 def remover_dispositivo(device_id):
     """Remove um dispositivo cadastrado (e seus dados)."""
     try:
-        nomes = carregar_nomes()
-        if device_id not in nomes:
-            return jsonify({"erro": "Dispositivo não encontrado"}), 404
-        del nomes[device_id]
-        salvar_nomes(nomes)
-        if device_id in localizacoes:
-            del localizacoes[device_id]
-        if device_id in historico:
-            del historico[device_id]
-            salvar_historico()
-        return jsonify({"ok": True})
+        with _nomes_lock:
+            nomes = carregar_nomes()
+            if device_id not in nomes:
+                return fast_json({"erro": "Dispositivo não encontrado"}), 404
+            del nomes[device_id]
+            salvar_nomes(nomes)
+        with _estado_lock:
+            localizacoes.pop(device_id, None)
+            if device_id in historico:
+                del historico[device_id]
+                salvar_historico()
+        return fast_json({"ok": True})
     except Exception as e:
-        return jsonify({"erro": str(e)}), 500
+        return fast_json({"erro": str(e)}), 500
 
 
 @app.route("/api/nomes", methods=["POST"])
 def salvar_nomes_api():
     """Salva o nome (e opcionalmente ícone/cor) de um dispositivo"""
     try:
-        data = request.get_json()
-        device_id = data.get("device_id")
+        data = ler_json()
+        if data is None:
+            return fast_json({"erro": "JSON inválido"}), 400
+        device_id = str(data.get("device_id") or "").strip()
         nome = (data.get("nome") or "").strip()
         icon = (data.get("icon") or "🚗").strip() or "🚗"
         color = (data.get("color") or "#00d4aa").strip() or "#00d4aa"
         if not device_id:
-            return jsonify({"erro": "device_id obrigatório"}), 400
-        nomes = carregar_nomes()
-        info = nomes.get(device_id, {})
-        if isinstance(info, dict):
-            info["nome"] = nome or device_id
-            info["icon"] = icon
-            info["color"] = color
-        else:
-            info = {"nome": nome or device_id, "icon": icon, "color": color}
-        nomes[device_id] = info
-        salvar_nomes(nomes)
-        return jsonify({"ok": True})
+            return fast_json({"erro": "device_id obrigatório"}), 400
+        with _nomes_lock:
+            nomes = carregar_nomes()
+            info = nomes.get(device_id, {})
+            if isinstance(info, dict):
+                info["nome"] = nome or device_id
+                info["icon"] = icon
+                info["color"] = color
+            else:
+                info = {"nome": nome or device_id, "icon": icon, "color": color}
+            nomes[device_id] = info
+            salvar_nomes(nomes)
+        return fast_json({"ok": True})
     except Exception as e:
-        return jsonify({"erro": str(e)}), 500
+        return fast_json({"erro": str(e)}), 500
 
 
 def _nominatim_to_results(nom_data):
@@ -315,20 +674,57 @@ def _req_nominatim(params, headers=None):
     h = {"User-Agent": "LocalizadorApp/1.0", "Accept-Language": "pt-BR"}
     if headers:
         h.update(headers)
-    url = "https://nominatim.openstreetmap.org/search?" + "&".join(f"{k}={quote(str(v))}" for k, v in params.items() if v)
     try:
-        r = requests.get(url, headers=h, timeout=10)
+        _aguardar_nominatim()
+        r = SESSION.get(
+            "https://nominatim.openstreetmap.org/search",
+            params={k: v for k, v in params.items() if v},
+            headers=h,
+            timeout=10,
+        )
         return r.json() if r.status_code == 200 else []
     except Exception:
         return []
 
 
+def _req_photon(q, bbox=None):
+    """Chama Photon e retorna resultados no formato unificado."""
+    try:
+        resp = SESSION.get(
+            "https://photon.komoot.io/api/",
+            params={"q": q, "limit": 10, "bbox": bbox},
+            timeout=10,
+        )
+        if resp.status_code == 200:
+            return _photon_to_results(resp.json().get("features") or [])
+    except Exception:
+        pass
+    return []
+
+
+def _primeiro_resultado(*consultas):
+    """Dispara as consultas em paralelo e devolve o primeiro resultado não vazio."""
+    futuros = [_geocode_pool.submit(c) for c in consultas]
+    try:
+        for fut in as_completed(futuros):
+            try:
+                results = fut.result()
+            except Exception:
+                continue
+            if results:
+                return results
+    finally:
+        for fut in futuros:
+            fut.cancel()
+    return []
+
+
 @app.route("/api/geocode")
 def geocode():
     """Busca endereços via Photon/Nominatim (evita CORS no navegador)"""
     q = (request.args.get("q") or "").strip()
     if not q:
-        return jsonify({"erro": "Parâmetro q obrigatório"}), 400
+        return fast_json({"erro": "Parâmetro q obrigatório"}), 400
 
     results = []
     cep = "".join(c for c in q if c.isdigit())
@@ -337,7 +733,7 @@ def geocode():
     # 1. CEP: ViaCEP -> Nominatim ESTRUTURADO (rua, cidade, estado)
     if len(cep) == 8:
         try:
-            r_cep = requests.get(f"https://viacep.com.br/ws/{cep}/json/", timeout=5)
+            r_cep = SESSION.get(f"https://viacep.com.br/ws/{cep}/json/", timeout=5)
             if r_cep.status_code == 200:
                 viacep_data = r_cep.json()
                 if not viacep_data.get("erro"):
@@ -380,31 +776,14 @@ def geocode():
 
     q_photon = _photon_query_simples(q)
 
-    # 2. Photon (query simplificada evita 400 Bad Request)
+    # 2/3. Photon simples e com bbox Brasil em paralelo (query simplificada evita 400 Bad Request)
     if not results:
-        try:
-            url = f"https://photon.komoot.io/api/?q={quote(q_photon)}&limit=10"
-            resp = requests.get(url, timeout=10)
-            if resp.status_code == 200:
-                data = resp.json()
-                features = data.get("features") or []
-                results = _photon_to_results(features)
-        except Exception:
-            pass
-
-    # 3. Photon com bbox Brasil
-    if not results:
-        try:
-            url = f"https://photon.komoot.io/api/?q={quote(q_photon)}&limit=10&bbox=-74,-33,-34,5"
-            resp = requests.get(url, timeout=10)
-            if resp.status_code == 200:
-                data = resp.json()
-                features = data.get("features") or []
-                results = _photon_to_results(features)
-        except Exception:
-            pass
+        results = _primeiro_resultado(
+            lambda: _req_photon(q_photon),
+            lambda: _req_photon(q_photon, bbox="-74,-33,-34,5"),
+        )
 
-    # 4. Nominatim free-form
+    # 4. Nominatim free-form (sequencial: a política do Nominatim é 1 req/s)
     if not results:
         nom = _req_nominatim({
             "format": "json",
@@ -437,35 +816,35 @@ def geocode():
         })
         results = _nominatim_to_results(nom)
 
-    return jsonify({"results": results})
+    return fast_json({"results": results})
 
 
 @app.route("/api/endereco/<device_id>")
 def obter_endereco(device_id):
-    """Retorna o endereço do dispositivo (reverse geocoding)"""
-    if device_id not in localizacoes:
-        return jsonify({"erro": "Dispositivo não encontrado"}), 404
-
-    loc = localizacoes[device_id]
-    if not loc.endereco:
-        loc.endereco = reverse_geocode(loc.lat, loc.lng)
+    """Retorna o endereço do dispositivo (calculado em segundo plano, nunca bloqueia)"""
+    loc = localizacoes.get(device_id)
+    if loc is None:
+        return fast_json({"erro": "Dispositivo não encontrado"}), 404
 
     resp = {
         "device_id": device_id,
-        "endereco": loc.endereco,
+        "endereco": loc.endereco or "Calculando...",
         "lat": loc.lat,
         "lng": loc.lng,
     }
     if loc.bateria is not None:
         resp["bateria"] = loc.bateria
-    return jsonify(resp)
+    return fast_json(resp)
+
+
+# PNG 1x1 transparente usado como favicon
+FAVICON_PNG = b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x06\x00\x00\x00\x1f\x15\xc4\x89\x00\x00\x00\nIDATx\x9cc\x00\x01\x00\x00\x05\x00\x01\r\n-\xb4\x00\x00\x00\x00IEND\xaeB`\x82"
 
 
 @app.route("/favicon.ico")
 def favicon():
     """Retorna favicon mínimo para evitar 404"""
-    png = b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x06\x00\x00\x00\x1f\x15\xc4\x89\x00\x00\x00\nIDATx\x9cc\x00\x01\x00\x00\x05\x00\x01\r\n-\xb4\x00\x00\x00\x00IEND\xaeB`\x82"
-    return Response(png, mimetype="image/png")
+    return Response(FAVICON_PNG, mimetype="image/png", headers={"Cache-Control": "public, max-age=31536000, immutable"})
 
 
 @app.route("/")
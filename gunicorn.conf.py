@@ -0,0 +1,13 @@
+"""
+Configuração do Gunicorn (carregada automaticamente por `gunicorn app:app`)
+Um único processo: localizações, histórico e caches vivem em memória e não
+são compartilhados entre workers. A concorrência vem das threads (gthread),
+que deixam as chamadas externas de geocoding sobreporem outras requisições.
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 10000)}"
+workers = 1
+worker_class = "gthread"
+threads = 8
+timeout = 30